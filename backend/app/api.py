@@ -1,46 +1,105 @@
-from fastapi import APIRouter, HTTPException, Request
-from starlette.status import HTTP_401_UNAUTHORIZED, HTTP_500_INTERNAL_SERVER_ERROR
+from fastapi import APIRouter, HTTPException
+from starlette.status import HTTP_500_INTERNAL_SERVER_ERROR
+import asyncio
 import logging
 import uuid
 import os
+from typing import Coroutine, Set
+
+from langchain_community.vectorstores import FAISS
 
 from .models import QueryRequest, QueryResponse
 from .config import settings
-from .extractor import extract_text_only
+from .extractor import extract_text_only_async
 from .chunker import chunk_text_only
-from .embedder import embed_chunks, save_faiss_index
-from .qa_pipeline import query_pipeline
+from .embedder import (
+    cleanup_expired_indexes,
+    embed_chunks_async,
+    embed_questions_async,
+    save_faiss_index,
+)
+from .qa_pipeline import FALLBACK_ANSWER, aquery_pipeline
+from .semantic_cache import semantic_cache
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# Strong references so background tasks are not garbage-collected mid-run
+_background_tasks: Set[asyncio.Task] = set()
+
+
+def _run_in_background(coro: Coroutine) -> None:
+    """Schedules a coroutine without awaiting it, keeping a reference until it finishes."""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+def _persist_index_in_background(vectorstore: FAISS) -> None:
+    """Saves the FAISS index off the request path, then expires old indexes."""
+    index_dir = os.path.join(settings.INDEX_DIR, str(uuid.uuid4()))
+
+    async def persist():
+        try:
+            await asyncio.to_thread(save_faiss_index, vectorstore, index_dir)
+            await asyncio.to_thread(
+                cleanup_expired_indexes, settings.INDEX_DIR, settings.INDEX_TTL_SECONDS
+            )
+        except Exception:
+            logger.exception(f"❌ Failed to persist FAISS index to: {index_dir}")
+
+    _run_in_background(persist())
+
 
-def verify_token(request: Request):
-    """Verifies the bearer token in request headers."""
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        logger.warning("🔐 Missing or invalid Authorization header.")
-        raise HTTPException(status_code=HTTP_401_UNAUTHORIZED, detail="Missing or invalid token")
+def _save_semantic_cache_in_background() -> None:
+    """Writes the semantic cache to disk in a worker thread; no-op if nothing changed."""
 
-    token = auth_header.split(" ")[1]
-    if token != settings.BEARER_TOKEN:
-        logger.warning("🔐 Unauthorized access attempt with invalid token.")
-        raise HTTPException(status_code=HTTP_401_UNAUTHORIZED, detail="Invalid token")
+    async def persist():
+        try:
+            await asyncio.to_thread(semantic_cache.save)
+        except Exception:
+            logger.exception("❌ Failed to persist semantic cache.")
+
+    _run_in_background(persist())
 
 
 @router.post("/hackrx/run", response_model=QueryResponse)
-async def run_query(payload: QueryRequest, request: Request):
+async def run_query(payload: QueryRequest):
     """
     Endpoint to process a document and answer user questions using LLM + vectorstore.
     This version only processes text (no tables).
+    Authentication is enforced by the bearer-token middleware in main.py.
     """
     try:
-        # Step 1: Token verification
-        verify_token(request)
-
-        # Step 2: Extract text only
+        # Step 1: Start extraction, and meanwhile embed questions and check the semantic cache
         logger.info("📄 Starting text extraction...")
-        text_blocks = extract_text_only(payload.documents)
+        extraction = asyncio.create_task(extract_text_only_async(payload.documents))
+
+        document = str(payload.documents)
+        try:
+            question_vectors, embedded = await embed_questions_async(
+                payload.questions, model_name=settings.EMBEDDING_MODEL_NAME
+            )
+        except Exception:
+            extraction.cancel()
+            raise
+
+        # Questions that could not be embedded get the fallback answer, as in the QA step
+        answers = [None if ok else FALLBACK_ANSWER for ok in embedded]
+        embedded_ids = [i for i, ok in enumerate(embedded) if ok]
+        if settings.SEMANTIC_CACHE_ENABLED and embedded_ids:
+            cached = semantic_cache.lookup(document, question_vectors[embedded_ids])
+            for i, answer in zip(embedded_ids, cached):
+                answers[i] = answer
+
+        pending = [i for i, answer in enumerate(answers) if answer is None]
+        if not pending:
+            extraction.cancel()
+            logger.info("💾 No questions left to answer after the semantic cache.")
+            return QueryResponse(answers=answers)
+
+        # Step 2: Wait for text extraction
+        text_blocks = await extraction
         logger.info(f"✅ Extracted {len(text_blocks)} text blocks.")
 
         # Step 3: Chunk text using settings
@@ -54,17 +113,26 @@ async def run_query(payload: QueryRequest, request: Request):
 
         # Step 4: Embed chunks to build vectorstore
         logger.info("📦 Embedding chunks and building vector store...")
-        vectorstore = embed_chunks(chunks, model_name=settings.EMBEDDING_MODEL_NAME)
+        vectorstore = await embed_chunks_async(chunks, model_name=settings.EMBEDDING_MODEL_NAME)
 
-        # Step 5: Save FAISS index
-        index_dir = f"indexes/{uuid.uuid4()}"
-        os.makedirs(index_dir, exist_ok=True)
-        save_faiss_index(vectorstore, index_dir=index_dir)
-        logger.info(f"🗂️ FAISS index saved to: {index_dir}")
+        # Step 5: Optionally save FAISS index without blocking the QA pipeline
+        if settings.PERSIST_INDEX:
+            _persist_index_in_background(vectorstore)
 
-        # Step 6: Run QA pipeline
+        # Step 6: Run QA pipeline on cache misses
         logger.info("❓ Answering questions using QA pipeline...")
-        answers = query_pipeline(payload.questions, vectorstore)
+        pending_vectors = question_vectors[pending]
+        new_answers = await aquery_pipeline(
+            [payload.questions[i] for i in pending], vectorstore, query_vectors=pending_vectors
+        )
+        for i, answer in zip(pending, new_answers):
+            answers[i] = answer
+
+        # Step 7: Cache successful answers
+        if settings.SEMANTIC_CACHE_ENABLED:
+            answered = [j for j, answer in enumerate(new_answers) if answer != FALLBACK_ANSWER]
+            semantic_cache.add(document, pending_vectors[answered], [new_answers[j] for j in answered])
+            _save_semantic_cache_in_background()
 
         return QueryResponse(answers=answers)
 
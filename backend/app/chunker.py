@@ -1,27 +1,73 @@
 import logging
+import re
 from typing import List
 
+import numpy as np
 from langchain_core.documents import Document
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 
 logger = logging.getLogger(__name__)
 
+# Preferred cut points, same as the separators previously given to RecursiveCharacterTextSplitter.
+# Compiled once; a single finditer pass yields every candidate boundary.
+_SEP = re.compile(r"\n\n|\n|\.| ")
+
+
+def chunk_text_only_fast(text: str, chunk_size: int, chunk_overlap: int) -> List[str]:
+    """
+    Greedily packs text into windows of at most chunk_size characters, cutting
+    just after a separator where possible and starting each window up to
+    chunk_overlap characters before the previous one ended.
+    """
+    n = len(text)
+    if n == 0:
+        return []
+
+    # All candidate cut offsets, found in a single regex scan
+    separator_ends = np.fromiter(
+        (m.end() for m in _SEP.finditer(text)), dtype=np.int64
+    )
+    cuts = np.unique(np.concatenate(([0], separator_ends, [n])))
+
+    pieces = []
+    start = prev_end = 0
+    while start < n:
+        limit = start + chunk_size
+        if limit >= n:
+            end = n
+        else:
+            # Largest cut point that keeps the window within chunk_size; hard cut if
+            # no separator fits or the window would not extend past the previous one
+            j = np.searchsorted(cuts, limit, side="right") - 1
+            end = int(cuts[j]) if cuts[j] > max(start, prev_end) else limit
+
+        piece = text[start:end].strip()
+        if piece:
+            pieces.append(piece)
+        if end >= n:
+            break
+        prev_end = end
+
+        # Earliest cut point inside the overlap region becomes the next start
+        k = np.searchsorted(cuts, max(end - chunk_overlap, start + 1), side="left")
+        start = int(cuts[k]) if k < len(cuts) and cuts[k] < end else end
+
+    return pieces
+
+
 def chunk_text_only(
     docs: List[Document],
     chunk_size: int ,
     chunk_overlap: int
 ) -> List[Document]:
     """
-    Splits LangChain Document objects into smaller chunks using RecursiveCharacterTextSplitter.
+    Splits LangChain Document objects into smaller chunks at separator boundaries.
     Preserves original metadata (e.g., page number).
     """
 
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size,
-        chunk_overlap=chunk_overlap,
-        separators=["\n\n", "\n", ".", " "]
-    )
-
-    split_docs = splitter.split_documents(docs)
+    split_docs = [
+        Document(page_content=piece, metadata=dict(doc.metadata))
+        for doc in docs
+        for piece in chunk_text_only_fast(doc.page_content, chunk_size, chunk_overlap)
+    ]
     logger.info(f"✅ Created {len(split_docs)} text chunks from {len(docs)} pages.")
     return split_docs
@@ -1,3 +1,5 @@
+import os
+import tempfile
 from typing import List
 from pydantic import Field
 from pydantic_settings import BaseSettings
@@ -15,8 +17,53 @@ class Settings(BaseSettings):
     # OpenAI API (newly added for QA & embeddings)
     OPENAI_API_KEY: str = Field(..., env="OPENAI_API_KEY")  # single key for OpenAI
     QA_MODEL_NAME: str = "gpt-4o-mini"  # default OpenAI chat model
+    QA_MAX_CONCURRENCY: int = 16  # in-flight chat completions per request
     EMBEDDING_MODEL_NAME: str = "text-embedding-3-small"  # default OpenAI embedding model
 
+    # Embedding cache (content hash -> vector, persisted across requests)
+    EMBEDDING_CACHE_PATH: str = "emb_cache.sqlite3"
+
+    # Embedding request batching
+    EMBEDDING_BATCH_SIZE: int = 256  # max inputs per embeddings request
+    EMBEDDING_MAX_TOKENS_PER_REQUEST: int = 250_000  # stays under OpenAI's 300k per-request cap
+    EMBEDDING_MAX_CONCURRENCY: int = 16  # in-flight embedding requests (avoids 429s)
+
+    # Vector index (built per request and discarded, so exact flat search is the cheapest default)
+    INDEX_TYPE: str = "flat"  # "flat" | "hnsw" | "ivfpq" | "sq8" (int8, cosine) | "fp16" (half-precision flat, cosine)
+    PERSIST_INDEX: bool = False  # write each request's index to INDEX_DIR in the background
+    INDEX_DIR: str = "indexes"
+    INDEX_TTL_SECONDS: int = 24 * 60 * 60  # persisted indexes older than this are deleted
+    USE_GPU: bool = True  # move the index to GPU 0 when faiss-gpu and a device are available
+
+    # HNSW graph
+    HNSW_M: int = 32  # graph neighbours per node
+    HNSW_EF_CONSTRUCTION: int = 200
+    HNSW_EF_SEARCH: int = 64  # higher = better recall, slower queries
+
+    # IVF-PQ (compressed; only used once a document has enough chunks to train on)
+    IVF_NLIST: int = 128
+    IVF_NPROBE: int = 16
+    PQ_M: int = 64  # sub-quantizers; must divide the embedding dimension
+    PQ_NBITS: int = 8
+    IVFPQ_MIN_VECTORS: int = 10_000  # below this, fall back to HNSW
+
+    # Retrieval
+    RETRIEVAL_K: int = 10  # chunks retrieved per question
+
+    # Semantic answer cache (question embedding -> answer, per document)
+    SEMANTIC_CACHE_ENABLED: bool = True
+    SEMANTIC_CACHE_PATH: str = "semantic_cache.pkl"
+    SEMANTIC_CACHE_THRESHOLD: float = 0.97  # min cosine similarity for a hit
+    SEMANTIC_CACHE_MAX_DOCUMENTS: int = 256  # least recently used documents are evicted beyond this
+    SEMANTIC_CACHE_MAX_ENTRIES_PER_DOCUMENT: int = 512  # newest answers kept per document
+
+    # Downloaded documents, cached by URL hash
+    DOC_CACHE_DIR: str = os.path.join(tempfile.gettempdir(), "doccache")
+
+    # PDF text extraction
+    PDF_EXTRACT_WORKERS: int = min(8, os.cpu_count() or 1)  # worker processes stay resident once started
+    PDF_PARALLEL_MIN_PAGES: int = 32  # smaller PDFs are extracted in-process
+
     # Chunking
     CHUNK_SIZE: int = 600
     CHUNK_OVERLAP: int = 100
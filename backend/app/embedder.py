@@ -1,19 +1,407 @@
-from typing import List
+from typing import Dict, List, Tuple
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
 from langchain.schema import Document
-from langchain_openai import OpenAIEmbeddings
+from langchain_core.embeddings import Embeddings
+from openai import AsyncOpenAI, OpenAI, RateLimitError
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_random_exponential
+import asyncio
+import copy
+import faiss
+import hashlib
+import httpx
 import logging
 import os
+import shutil
+import sqlite3
+import threading
+import time
+import numpy as np
+import tiktoken
 from dotenv import load_dotenv
 
+from .config import settings
+
 # Load environment variables
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+# SQLite caps the number of bound parameters per statement
+_SQLITE_MAX_VARS = 500
+
+# Shared GPU resources (scratch memory, streams), created on first use
+_gpu_resources = None
+_gpu_resources_lock = threading.Lock()
+
+# One embeddings wrapper (and its keep-alive HTTP pools) per model, reused across requests
+_embeddings_cache: Dict[str, "CachedEmbeddings"] = {}
+_embeddings_lock = threading.Lock()
+_HTTP_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=32)
+
+
+def _get_encoding(model_name: str) -> tiktoken.Encoding:
+    try:
+        return tiktoken.encoding_for_model(model_name)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def _batch_texts(
+    texts: List[str],
+    model_name: str,
+    batch_size: int = settings.EMBEDDING_BATCH_SIZE,
+    max_tokens: int = settings.EMBEDDING_MAX_TOKENS_PER_REQUEST
+) -> List[np.ndarray]:
+    """
+    Groups texts into request-sized batches bounded by input count and token budget.
+    Texts are packed longest-first so each batch holds similarly sized inputs.
+
+    Args:
+        texts (List[str]): Texts to embed.
+        model_name (str): Embedding model, used to pick the tokenizer.
+        batch_size (int): Max number of inputs per request.
+        max_tokens (int): Max total tokens per request.
+
+    Returns:
+        List[np.ndarray]: Batches of indices into texts, covering every text once.
+    """
+    encoding = _get_encoding(model_name)
+    token_counts = np.fromiter(
+        (len(tokens) for tokens in encoding.encode_batch(texts, disallowed_special=())),
+        dtype=np.int64,
+        count=len(texts)
+    )
+    order = np.argsort(token_counts, kind="stable")[::-1]
+
+    batches: List[np.ndarray] = []
+    start = 0
+    current_tokens = 0
+    for pos, idx in enumerate(order):
+        n_tokens = int(token_counts[idx])
+        if pos > start and (pos - start >= batch_size or current_tokens + n_tokens > max_tokens):
+            batches.append(order[start:pos])
+            start, current_tokens = pos, 0
+        current_tokens += n_tokens
+    if start < len(order):
+        batches.append(order[start:])
+    return batches
+
+
+def _scatter(batches: List[np.ndarray], results: List[List[List[float]]]) -> np.ndarray:
+    """Puts per-batch embeddings back into original text order."""
+    order = np.concatenate(batches)
+    vectors = np.asarray([vec for result in results for vec in result], dtype=np.float32)
+    out = np.empty_like(vectors)
+    out[order] = vectors
+    return out
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    OpenAI embeddings with a persistent, content-addressed vector cache.
+    Only chunks whose (model, text) hash is not cached are sent to OpenAI,
+    in token-budgeted batches.
+    """
+
+    def __init__(self, model_name: str, cache_path: str = settings.EMBEDDING_CACHE_PATH):
+        self.model_name = model_name
+        self.client = OpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            http_client=httpx.Client(limits=_HTTP_LIMITS)
+        )
+        self.async_client = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            http_client=httpx.AsyncClient(limits=_HTTP_LIMITS)
+        )
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(cache_path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vec BLOB NOT NULL)"
+            )
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256((self.model_name + "\x00" + text).encode("utf-8")).hexdigest()
+
+    def _lookup(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        found: Dict[str, np.ndarray] = {}
+        unique_keys = list(dict.fromkeys(keys))
+        with self._lock:
+            for start in range(0, len(unique_keys), _SQLITE_MAX_VARS):
+                batch = unique_keys[start:start + _SQLITE_MAX_VARS]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vec FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def _store(self, vectors: Dict[str, np.ndarray]) -> None:
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vec) VALUES (?, ?)",
+                [(key, vec.tobytes()) for key, vec in vectors.items()]
+            )
+
+    def _embed_uncached(self, texts: List[str]) -> np.ndarray:
+        batches = _batch_texts(texts, self.model_name)
+        results = []
+        for batch in batches:
+            response = self.client.embeddings.create(
+                model=self.model_name, input=[texts[i] for i in batch]
+            )
+            results.append([item.embedding for item in response.data])
+        logger.info(f"🌐 Embedded {len(texts)} texts in {len(batches)} request(s).")
+        return _scatter(batches, results)
+
+    @retry(
+        retry=retry_if_exception_type(RateLimitError),
+        wait=wait_random_exponential(min=1, max=30),
+        stop=stop_after_attempt(6),
+        reraise=True
+    )
+    async def _aembed_batch(self, batch: List[str], semaphore: asyncio.Semaphore) -> List[List[float]]:
+        async with semaphore:
+            response = await self.async_client.embeddings.create(model=self.model_name, input=batch)
+        return [item.embedding for item in response.data]
+
+    async def _aembed_uncached(self, texts: List[str]) -> np.ndarray:
+        batches = await asyncio.to_thread(_batch_texts, texts, self.model_name)
+        semaphore = asyncio.Semaphore(settings.EMBEDDING_MAX_CONCURRENCY)
+        results = await asyncio.gather(
+            *(self._aembed_batch([texts[i] for i in batch], semaphore) for batch in batches)
+        )
+        logger.info(f"🌐 Embedded {len(texts)} texts in {len(batches)} concurrent request(s).")
+        return _scatter(batches, results)
+
+    def _cached_vectors(self, texts: List[str]) -> Tuple[List[str], Dict[str, np.ndarray], List[int]]:
+        """
+        Looks up cached vectors and returns the indices still to embed.
+        Repeated texts (e.g. per-page headers/footers) share a key, so only
+        their first occurrence is embedded and the vector is reused for the rest.
+        """
+        keys = [self._key(text) for text in texts]
+        vectors = self._lookup(keys)
+        first_index: Dict[str, int] = {}
+        for i, key in enumerate(keys):
+            if key not in vectors:
+                first_index.setdefault(key, i)
+        return keys, vectors, list(first_index.values())
+
+    def _merge_embedded(
+        self,
+        keys: List[str],
+        vectors: Dict[str, np.ndarray],
+        misses: List[int],
+        embedded: np.ndarray
+    ) -> np.ndarray:
+        if misses:
+            new_vectors = {keys[i]: vec for i, vec in zip(misses, embedded)}
+            self._store(new_vectors)
+            vectors.update(new_vectors)
+
+        logger.info(
+            f"🧠 Embedding cache: {len(keys)} texts, {len(set(keys))} unique, {len(misses)} embedded."
+        )
+        if not keys:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.stack([vectors[key] for key in keys])
+
+    def _embed_array(self, texts: List[str]) -> np.ndarray:
+        """Embeds texts, serving cached vectors where available; float32 matrix, one row per text."""
+        keys, vectors, misses = self._cached_vectors(texts)
+        embedded = self._embed_uncached([texts[i] for i in misses]) if misses else None
+        return self._merge_embedded(keys, vectors, misses, embedded)
+
+    async def _aembed_array(self, texts: List[str]) -> np.ndarray:
+        """
+        Async variant of _embed_array; cache-miss batches are sent concurrently.
+        Hashing, tokenizing and SQLite access run in worker threads, off the event loop.
+        """
+        keys, vectors, misses = await asyncio.to_thread(self._cached_vectors, texts)
+        embedded = await self._aembed_uncached([texts[i] for i in misses]) if misses else None
+        return await asyncio.to_thread(self._merge_embedded, keys, vectors, misses, embedded)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embeds texts, serving cached vectors where available.
+
+        Args:
+            texts (List[str]): Texts to embed.
+
+        Returns:
+            List[List[float]]: One vector per input text, in input order.
+        """
+        return self._embed_array(texts).tolist()
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Async variant of embed_documents; cache-miss batches are sent concurrently.
+
+        Args:
+            texts (List[str]): Texts to embed.
+
+        Returns:
+            List[List[float]]: One vector per input text, in input order.
+        """
+        return (await self._aembed_array(texts)).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        response = self.client.embeddings.create(model=self.model_name, input=[text])
+        return response.data[0].embedding
+
+    async def aembed_query(self, text: str) -> List[float]:
+        response = await self.async_client.embeddings.create(model=self.model_name, input=[text])
+        return response.data[0].embedding
+
+
+def get_embeddings(model_name: str) -> CachedEmbeddings:
+    """Returns the process-wide CachedEmbeddings for a model, creating it on first use."""
+    with _embeddings_lock:
+        if model_name not in _embeddings_cache:
+            _embeddings_cache[model_name] = CachedEmbeddings(model_name)
+        return _embeddings_cache[model_name]
+
+
+def _apply_search_params(index: faiss.Index) -> None:
+    """Applies query-time index parameters from settings."""
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = settings.HNSW_EF_SEARCH
+    elif isinstance(index, faiss.IndexIVF):
+        index.nprobe = settings.IVF_NPROBE
+
+
+# Scalar-quantized, inner-product index types (both searched exhaustively, like Flat)
+_SCALAR_QUANTIZERS = {
+    "sq8": faiss.ScalarQuantizer.QT_8bit,
+    "fp16": faiss.ScalarQuantizer.QT_fp16,
+}
+
+
+def _create_index(vectors: np.ndarray) -> faiss.Index:
+    """
+    Creates and fills a FAISS index of type settings.INDEX_TYPE.
+    IVF-PQ falls back to HNSW when there are too few vectors to train it.
+    Inner-product indexes (sq8, fp16) are built over L2-normalized vectors, so
+    scores are cosine similarities.
+
+    Args:
+        vectors (np.ndarray): float32 matrix of shape (n, d); normalized in place
+            for inner-product indexes.
+
+    Returns:
+        faiss.Index: Populated index.
+    """
+    n, d = vectors.shape
+    index_type = settings.INDEX_TYPE.lower()
+
+    if index_type == "ivfpq":
+        if n < max(settings.IVFPQ_MIN_VECTORS, settings.IVF_NLIST, 2 ** settings.PQ_NBITS):
+            logger.info(f"ℹ️ {n} vectors is too few to train IVF-PQ; using HNSW instead.")
+            index_type = "hnsw"
+        elif d % settings.PQ_M != 0:
+            logger.warning(f"⚠️ PQ_M={settings.PQ_M} does not divide dimension {d}; using HNSW instead.")
+            index_type = "hnsw"
+
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(d)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(d, settings.HNSW_M)
+        index.hnsw.efConstruction = settings.HNSW_EF_CONSTRUCTION
+    elif index_type == "ivfpq":
+        quantizer = faiss.IndexFlatL2(d)
+        index = faiss.IndexIVFPQ(quantizer, d, settings.IVF_NLIST, settings.PQ_M, settings.PQ_NBITS)
+        index.train(vectors)
+    elif index_type in _SCALAR_QUANTIZERS:
+        faiss.normalize_L2(vectors)
+        index = faiss.IndexScalarQuantizer(
+            d, _SCALAR_QUANTIZERS[index_type], faiss.METRIC_INNER_PRODUCT
+        )
+        index.train(vectors)
+    else:
+        raise ValueError(f"Unsupported INDEX_TYPE: {settings.INDEX_TYPE}")
+
+    _apply_search_params(index)
+    index.add(vectors)
+    logger.info(f"🧮 Built {index_type} index over {n} vectors.")
+    return index
+
+
+def _configure_metric(db: FAISS) -> None:
+    """Makes the vectorstore normalize queries when its index scores by inner product."""
+    if db.index.metric_type == faiss.METRIC_INNER_PRODUCT:
+        db._normalize_L2 = True
+        db.distance_strategy = DistanceStrategy.MAX_INNER_PRODUCT
+
+
+def _is_gpu_index(index: faiss.Index) -> bool:
+    gpu_index_cls = getattr(faiss, "GpuIndex", None)
+    return gpu_index_cls is not None and isinstance(index, gpu_index_cls)
+
+
+# CPU index types that faiss.index_cpu_to_gpu can clone; anything else (HNSW,
+# flat scalar quantizers) stays on CPU without attempting the copy
+_GPU_INDEX_TYPES = (faiss.IndexFlat, faiss.IndexIVFFlat, faiss.IndexIVFScalarQuantizer, faiss.IndexIVFPQ)
+
+
+def _maybe_to_gpu(index: faiss.Index) -> faiss.Index:
+    """
+    Moves an index to GPU 0 if enabled and available, otherwise returns it unchanged.
+    Index types without a GPU implementation (e.g. HNSW) stay on CPU.
+    """
+    global _gpu_resources
+
+    if not settings.USE_GPU or not hasattr(faiss, "get_num_gpus") or faiss.get_num_gpus() == 0:
+        return index
+    if not isinstance(index, _GPU_INDEX_TYPES):
+        return index
+
+    try:
+        with _gpu_resources_lock:
+            if _gpu_resources is None:
+                _gpu_resources = faiss.StandardGpuResources()
+        gpu_index = faiss.index_cpu_to_gpu(_gpu_resources, 0, index)
+        logger.info("⚡ Moved FAISS index to GPU.")
+        return gpu_index
+    except Exception as e:
+        logger.warning(f"⚠️ Keeping FAISS index on CPU: {e}")
+        return index
+
+
+def _build_vectorstore(
+    chunks: List[Document],
+    vectors: np.ndarray,
+    embedding_function: Embeddings
+) -> FAISS:
+    """
+    Builds a FAISS vectorstore from precomputed chunk embeddings.
+
+    Args:
+        chunks (List[Document]): Chunks, in the same order as vectors.
+        vectors (np.ndarray): One embedding per chunk; may be normalized in place.
+        embedding_function (Embeddings): Used to embed queries at search time.
+
+    Returns:
+        FAISS: Vectorstore wrapping the index chosen by settings.INDEX_TYPE.
+    """
+    index = _maybe_to_gpu(_create_index(np.ascontiguousarray(vectors, dtype=np.float32)))
+
+    db = FAISS(
+        embedding_function=embedding_function,
+        index=index,
+        docstore=InMemoryDocstore({str(i): chunk for i, chunk in enumerate(chunks)}),
+        index_to_docstore_id={i: str(i) for i in range(len(chunks))}
+    )
+    _configure_metric(db)
+    return db
+
+
 def embed_chunks(chunks: List[Document], model_name: str) -> FAISS:
     """
-    Creates a FAISS vectorstore from chunks using OpenAI Embeddings.
+    Creates a FAISS vectorstore from chunks using cached OpenAI Embeddings.
 
     Args:
         chunks (List[Document]): List of langchain Document objects.
@@ -26,11 +414,33 @@ def embed_chunks(chunks: List[Document], model_name: str) -> FAISS:
         logger.warning("No chunks to embed.")
         return None
 
-    embedding_function = OpenAIEmbeddings(
-        model=model_name,
-        openai_api_key=os.getenv("OPENAI_API_KEY")
-    )
-    db = FAISS.from_documents(chunks, embedding_function)
+    embedding_function = get_embeddings(model_name)
+    vectors = embedding_function._embed_array([chunk.page_content for chunk in chunks])
+    db = _build_vectorstore(chunks, vectors, embedding_function)
+
+    logger.info(f"✅ Embedded and created FAISS vectorstore using OpenAI model: {model_name}")
+    return db
+
+
+async def embed_chunks_async(chunks: List[Document], model_name: str) -> FAISS:
+    """
+    Async variant of embed_chunks; embedding batches are requested concurrently.
+
+    Args:
+        chunks (List[Document]): List of langchain Document objects.
+        model_name (str): Name of the OpenAI embedding model.
+
+    Returns:
+        FAISS: Vectorstore created from embedded chunks.
+    """
+    if not chunks:
+        logger.warning("No chunks to embed.")
+        return None
+
+    embedding_function = get_embeddings(model_name)
+    vectors = await embedding_function._aembed_array([chunk.page_content for chunk in chunks])
+    # Index build/training is CPU-heavy; FAISS releases the GIL, so other requests keep running
+    db = await asyncio.to_thread(_build_vectorstore, chunks, vectors, embedding_function)
 
     logger.info(f"✅ Embedded and created FAISS vectorstore using OpenAI model: {model_name}")
     return db
@@ -38,17 +448,38 @@ def embed_chunks(chunks: List[Document], model_name: str) -> FAISS:
 
 def save_faiss_index(vectorstore: FAISS, index_dir: str) -> None:
     """
-    Saves a FAISS index to disk.
+    Saves a FAISS index to disk (index.faiss) along with its pickled docstore (index.pkl).
 
     Args:
         vectorstore (FAISS): The FAISS object to save.
         index_dir (str): Directory to save the FAISS index.
     """
     os.makedirs(index_dir, exist_ok=True)
+    if _is_gpu_index(vectorstore.index):
+        vectorstore = copy.copy(vectorstore)
+        vectorstore.index = faiss.index_gpu_to_cpu(vectorstore.index)
     vectorstore.save_local(index_dir)
     logger.info(f"📦 FAISS index saved at: {index_dir}")
 
 
+def cleanup_expired_indexes(root_dir: str, ttl_seconds: int) -> None:
+    """
+    Deletes saved FAISS index directories under root_dir older than ttl_seconds.
+
+    Args:
+        root_dir (str): Directory holding one sub-directory per saved index.
+        ttl_seconds (int): Maximum age, by modification time.
+    """
+    if not os.path.isdir(root_dir):
+        return
+
+    cutoff = time.time() - ttl_seconds
+    for entry in os.scandir(root_dir):
+        if entry.is_dir() and entry.stat().st_mtime < cutoff:
+            shutil.rmtree(entry.path, ignore_errors=True)
+            logger.info(f"🧹 Removed expired FAISS index: {entry.path}")
+
+
 def load_faiss_index(index_dir: str, model_name: str) -> FAISS:
     """
     Loads a FAISS index from disk.
@@ -63,11 +494,47 @@ def load_faiss_index(index_dir: str, model_name: str) -> FAISS:
     if not os.path.exists(index_dir):
         raise FileNotFoundError(f"Index not found at: {index_dir}")
 
-    embedding_function = OpenAIEmbeddings(
-        model=model_name,
-        openai_api_key=os.getenv("OPENAI_API_KEY")  # fixed here
-    )
+    embedding_function = get_embeddings(model_name)
     db = FAISS.load_local(index_dir, embedding_function, allow_dangerous_deserialization=True)
+    _apply_search_params(db.index)
+    _configure_metric(db)
+    db.index = _maybe_to_gpu(db.index)
 
     logger.info(f"📂 Loaded FAISS index from: {index_dir}")
     return db
+
+
+async def embed_questions_async(questions: List[str], model_name: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Embeds all questions in one batched, cached call.
+    If the batch is rejected (e.g. an empty or over-long question), questions are
+    embedded one by one so only the offending ones are lost.
+
+    Args:
+        questions (List[str]): List of user questions.
+        model_name (str): Name of the OpenAI embedding model.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: float32 matrix with one row per question
+        (zeros where embedding failed) and a boolean mask of embedded questions.
+    """
+    embedding_function = get_embeddings(model_name)
+    try:
+        vectors = await embedding_function._aembed_array(questions)
+        return vectors, np.ones(len(questions), dtype=bool)
+    except Exception as e:
+        logger.warning(f"⚠️ Batched question embedding failed ({e}); embedding questions one by one.")
+
+    results = await asyncio.gather(
+        *(embedding_function._aembed_array([question]) for question in questions),
+        return_exceptions=True
+    )
+    embedded = np.array([not isinstance(result, BaseException) for result in results], dtype=bool)
+    dim = next((result.shape[1] for result in results if not isinstance(result, BaseException)), 0)
+    vectors = np.zeros((len(questions), dim), dtype=np.float32)
+    for i, result in enumerate(results):
+        if isinstance(result, BaseException):
+            logger.error(f"⛔ Failed to embed question '{questions[i]}': {result}")
+        else:
+            vectors[i] = result[0]
+    return vectors, embedded
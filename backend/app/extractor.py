@@ -1,104 +1,191 @@
+import asyncio
+import hashlib
 import os
 import tempfile
 import logging
+import multiprocessing
+import threading
 import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from email import policy as email_policy
+from email.parser import BytesParser
 from typing import List, Union
 from urllib.parse import urlparse
 
+import fitz
+import httpx
 import requests
 import pandas as pd
 from pydantic import HttpUrl
-from fpdf import FPDF
+from bs4 import BeautifulSoup
 from PIL import Image
 from docx import Document as DocxDocument
 from langchain_core.documents import Document as LCDocument
-from langchain_community.document_loaders import PyMuPDFLoader
+
+from .config import settings
+from .pdf_pages import extract_pdf_pages
 
 logger = logging.getLogger(__name__)
 
+# Worker processes for large-PDF extraction, created on first use. Workers are
+# spawned, not forked: this runs in a thread of a multi-threaded server, and a
+# fork could copy locks held by other threads (MuPDF, logging) into the child.
+_pdf_pool = None
+_pdf_pool_lock = threading.Lock()
+
 # ------------------------------
 # File Download Utility
 # ------------------------------
+def _download_cache_path(file_url: str, default_suffix: str) -> str:
+    """Cache location for a URL: DOC_CACHE_DIR/<sha256(url)><ext>."""
+    parsed = urlparse(file_url)
+    ext = os.path.splitext(parsed.path)[1]
+    if not ext:
+        ext = default_suffix
+
+    url_hash = hashlib.sha256(file_url.encode("utf-8")).hexdigest()
+    return os.path.join(settings.DOC_CACHE_DIR, f"{url_hash}{ext}")
+
+
 def download_file(file_url: str, default_suffix: str) -> str:
+    """Streams a file to a cache path keyed by the URL's SHA-256, reusing earlier downloads."""
+    cache_path = _download_cache_path(file_url, default_suffix)
+    if os.path.exists(cache_path):
+        logger.info(f"💾 Using cached download for {file_url}: {cache_path}")
+        return cache_path
+
     logger.info(f"🌐 Downloading file from URL: {file_url}")
     try:
-        parsed = urlparse(file_url)
-        ext = os.path.splitext(parsed.path)[1]
-        if not ext:
-            ext = default_suffix
+        os.makedirs(settings.DOC_CACHE_DIR, exist_ok=True)
+        with requests.get(file_url, stream=True, timeout=20) as response:
+            response.raise_for_status()
+            # Write to a temp file first so a failed download never leaves a partial cache entry
+            tmp_file = tempfile.NamedTemporaryFile(
+                delete=False, dir=settings.DOC_CACHE_DIR, suffix=".part"
+            )
+            try:
+                with tmp_file:
+                    for chunk in response.iter_content(chunk_size=1 << 16):
+                        tmp_file.write(chunk)
+                os.replace(tmp_file.name, cache_path)
+            except BaseException:
+                os.unlink(tmp_file.name)
+                raise
 
-        response = requests.get(file_url, timeout=20)
-        response.raise_for_status()
-
-        with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp_file:
-            tmp_file.write(response.content)
-            temp_path = tmp_file.name
-
-        logger.info(f"✅ File downloaded to: {temp_path}")
-        return temp_path
+        logger.info(f"✅ File downloaded to: {cache_path}")
+        return cache_path
     except requests.RequestException as e:
         logger.error(f"❌ Failed to download file: {e}")
         raise
 
-# ------------------------------
-# PDF Writing Helper
-# ------------------------------
-def _safe_pdf_write(pdf: FPDF, text: str, cell_h=8):
-    """Write text to PDF with unicode fallback."""
+
+async def download_file_async(file_url: str, default_suffix: str) -> str:
+    """Async variant of download_file using httpx; shares the same cache."""
+    cache_path = _download_cache_path(file_url, default_suffix)
+    if os.path.exists(cache_path):
+        logger.info(f"💾 Using cached download for {file_url}: {cache_path}")
+        return cache_path
+
+    logger.info(f"🌐 Downloading file from URL: {file_url}")
     try:
-        pdf.multi_cell(0, cell_h, txt=text)
-    except UnicodeEncodeError:
-        pdf.multi_cell(0, cell_h, txt=text.encode('latin-1', 'replace').decode('latin-1'))
+        os.makedirs(settings.DOC_CACHE_DIR, exist_ok=True)
+        async with httpx.AsyncClient(timeout=20, follow_redirects=True) as client:
+            async with client.stream("GET", file_url) as response:
+                response.raise_for_status()
+                tmp_file = tempfile.NamedTemporaryFile(
+                    delete=False, dir=settings.DOC_CACHE_DIR, suffix=".part"
+                )
+                # BaseException also covers cancellation, e.g. on a semantic cache hit
+                try:
+                    with tmp_file:
+                        async for chunk in response.aiter_bytes(chunk_size=1 << 16):
+                            tmp_file.write(chunk)
+                    os.replace(tmp_file.name, cache_path)
+                except BaseException:
+                    os.unlink(tmp_file.name)
+                    raise
+
+        logger.info(f"✅ File downloaded to: {cache_path}")
+        return cache_path
+    except httpx.HTTPError as e:
+        logger.error(f"❌ Failed to download file: {e}")
+        raise
 
 # ------------------------------
-# Linux + Windows-Compatible Converters
+# Direct Text Extractors (no PDF round-trip)
 # ------------------------------
-def docx_to_pdf(docx_path: str) -> str:
-    logger.info(f"📝 Converting DOCX to PDF: {docx_path}")
+def extract_text_docx(docx_path: str) -> List[LCDocument]:
+    logger.info(f"📝 Extracting text from DOCX: {docx_path}")
     try:
-        pdf_path = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf").name
-        
-        # Load DOCX
         doc = DocxDocument(docx_path)
-        
-        # Init PDF
-        pdf = FPDF()
-        pdf.add_page()
-        
-        # Fonts folder relative to project root
-        base_dir = os.path.dirname(os.path.abspath(__file__))  # /app/app
-        font_dir = os.path.join(base_dir, "fonts")  # /app/app/fonts
-        font_path = os.path.join(font_dir, "DejaVuSans.ttf")
-
-        # Auto-create fonts folder & download font if missing
-        if not os.path.exists(font_path):
-            os.makedirs(font_dir, exist_ok=True)
-            logger.warning(f"⚠️ Font missing. Downloading DejaVuSans.ttf to {font_path}...")
-            url = "https://github.com/dejavu-fonts/dejavu-fonts/raw/master/ttf/DejaVuSans.ttf"
-            r = requests.get(url, timeout=20)
-            r.raise_for_status()
-            with open(font_path, "wb") as f:
-                f.write(r.content)
-            logger.info("✅ Font downloaded successfully.")
-
-        pdf.add_font("DejaVu", "", font_path, uni=True)
-        pdf.set_font("DejaVu", size=12)
-        
-        for para in doc.paragraphs:
-            text = para.text.strip()
-            if text:
-                pdf.multi_cell(0, 8, text)
-        
-        pdf.output(pdf_path)
-        logger.info(f"✅ Saved PDF: {pdf_path}")
-        return pdf_path
+        paragraphs = [para.text.strip() for para in doc.paragraphs if para.text.strip()]
+        if not paragraphs:
+            return []
+        return [LCDocument(
+            page_content="\n\n".join(paragraphs),
+            metadata={"source": docx_path, "page": 0}
+        )]
+    except Exception as e:
+        logger.error(f"❌ Failed to extract text from DOCX: {e}")
+        raise
 
+def extract_text_xlsx(xlsx_path: str) -> List[LCDocument]:
+    logger.info(f"📊 Extracting text from XLSX: {xlsx_path}")
+    try:
+        sheets = pd.read_excel(xlsx_path, sheet_name=None)
+        docs = []
+        for page, (sheet_name, df) in enumerate(sheets.items()):
+            rows = [" | ".join(str(cell) for cell in row) for row in df.itertuples(index=False)]
+            if rows:
+                docs.append(LCDocument(
+                    page_content="\n".join(rows),
+                    metadata={"source": xlsx_path, "page": page, "sheet": sheet_name}
+                ))
+        return docs
     except Exception as e:
-        logger.error(f"❌ Failed to convert DOCX to PDF: {e}")
+        logger.error(f"❌ Failed to extract text from XLSX: {e}")
         raise
 
+def _email_document(path: str, sender, to, date, subject, body: str) -> LCDocument:
+    content = f"From: {sender}\nTo: {to}\nDate: {date}\nSubject: {subject}\n\n{body}"
+    return LCDocument(page_content=content, metadata={"source": path, "page": 0})
+
+def extract_text_eml(eml_path: str) -> List[LCDocument]:
+    logger.info(f"📧 Extracting text from EML: {eml_path}")
+    try:
+        with open(eml_path, "rb") as f:
+            msg = BytesParser(policy=email_policy.default).parse(f)
+
+        part = msg.get_body(preferencelist=("plain", "html"))
+        body = part.get_content() if part is not None else ""
+        if part is not None and part.get_content_type() == "text/html":
+            body = BeautifulSoup(body, "html.parser").get_text("\n")
 
+        return [_email_document(eml_path, msg["From"], msg["To"], msg["Date"], msg["Subject"], body)]
+    except Exception as e:
+        logger.error(f"❌ Failed to extract text from EML: {e}")
+        raise
+
+def extract_text_msg(msg_path: str) -> List[LCDocument]:
+    logger.info(f"📨 Extracting text from MSG: {msg_path}")
+    try:
+        import extract_msg
+        msg = extract_msg.Message(msg_path)
+        try:
+            return [_email_document(msg_path, msg.sender, msg.to, msg.date, msg.subject, msg.body or "")]
+        finally:
+            msg.close()
+    except ImportError:
+        logger.error("❌ extract_msg package not installed. Run: pip install extract_msg")
+        raise
+    except Exception as e:
+        logger.error(f"❌ Failed to extract text from MSG: {e}")
+        raise
 
+# ------------------------------
+# Linux + Windows-Compatible Converters
+# ------------------------------
 def image_to_pdf(image_path: str) -> str:
     logger.info(f"🖼️ Converting image to PDF: {image_path}")
     try:
@@ -111,28 +198,6 @@ def image_to_pdf(image_path: str) -> str:
         logger.error(f"❌ Failed to convert image to PDF: {e}")
         raise
 
-def xlsx_to_pdf(xlsx_path: str) -> str:
-    logger.info(f"📊 Converting XLSX to PDF: {xlsx_path}")
-    try:
-        df = pd.read_excel(xlsx_path)
-        pdf_path = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf").name
-
-        pdf = FPDF()
-        pdf.set_auto_page_break(auto=True, margin=15)
-        pdf.add_page()
-        pdf.set_font("Arial", size=10)
-
-        for _, row in df.iterrows():
-            row_str = " | ".join(str(cell) for cell in row)
-            _safe_pdf_write(pdf, row_str, cell_h=8)
-
-        pdf.output(pdf_path)
-        logger.info(f"✅ XLSX converted to PDF: {pdf_path}")
-        return pdf_path
-    except Exception as e:
-        logger.error(f"❌ Failed to convert XLSX to PDF: {e}")
-        raise
-
 def process_pdf_zip(zip_path: str) -> str:
     logger.info(f"📦 Extracting PDF from ZIP: {zip_path}")
     try:
@@ -147,58 +212,79 @@ def process_pdf_zip(zip_path: str) -> str:
         logger.error(f"❌ Failed to process ZIP: {e}")
         raise
 
-def eml_to_pdf(eml_path: str) -> str:
-    logger.info(f"📧 Converting EML to PDF: {eml_path}")
-    try:
-        pdf_path = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf").name
-        pdf = FPDF()
-        pdf.set_auto_page_break(auto=True, margin=15)
-        pdf.add_page()
-        pdf.set_font("Arial", size=10)
+# ------------------------------
+# PDF Text Extraction
+# ------------------------------
+def _get_pdf_pool() -> ProcessPoolExecutor:
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is None:
+            _pdf_pool = ProcessPoolExecutor(
+                max_workers=settings.PDF_EXTRACT_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pdf_pool
 
-        with open(eml_path, "r", encoding="utf-8", errors="ignore") as f:
-            content = f.read()
-            _safe_pdf_write(pdf, content, cell_h=5)
+def _reset_pdf_pool(pool: ProcessPoolExecutor) -> None:
+    """Drops a broken pool so the next large PDF gets a fresh one."""
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is pool:
+            _pdf_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
 
-        pdf.output(pdf_path)
-        logger.info(f"✅ EML converted to PDF: {pdf_path}")
-        return pdf_path
-    except Exception as e:
-        logger.error(f"❌ Failed to convert EML to PDF: {e}")
-        raise
+def extract_text_pdf(file_path: str) -> List[LCDocument]:
+    """
+    Extracts one Document per non-empty PDF page with PyMuPDF.
+    Large PDFs are split into page ranges extracted in parallel worker
+    processes, since PyMuPDF does not support concurrent use from threads.
+    """
+    with fitz.open(file_path) as doc:
+        total_pages = doc.page_count
+        workers = min(settings.PDF_EXTRACT_WORKERS, total_pages)
+        parallel = total_pages >= settings.PDF_PARALLEL_MIN_PAGES and workers > 1
 
-def msg_to_pdf(msg_path: str) -> str:
-    logger.info(f"📨 Converting MSG to PDF: {msg_path}")
-    try:
-        import extract_msg
-        msg = extract_msg.Message(msg_path)
-        pdf_path = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf").name
+    texts = None
+    if parallel:
+        pool = _get_pdf_pool()
+        bounds = [total_pages * i // workers for i in range(workers + 1)]
+        try:
+            futures = [
+                pool.submit(extract_pdf_pages, file_path, start, stop)
+                for start, stop in zip(bounds, bounds[1:])
+            ]
+            texts = [text for future in futures for text in future.result()]
+        except BrokenProcessPool as e:
+            logger.warning(f"⚠️ PDF worker pool broke ({e}); extracting in-process instead.")
+            _reset_pdf_pool(pool)
 
-        pdf = FPDF()
-        pdf.set_auto_page_break(auto=True, margin=15)
-        pdf.add_page()
-        pdf.set_font("Arial", size=10)
+    if texts is None:
+        texts = extract_pdf_pages(file_path, 0, total_pages)
 
-        content = f"From: {msg.sender}\nTo: {msg.to}\nDate: {msg.date}\nSubject: {msg.subject}\n\n{msg.body}"
-        _safe_pdf_write(pdf, content, cell_h=5)
+    return [
+        LCDocument(
+            page_content=text,
+            metadata={"source": file_path, "file_path": file_path, "page": i, "total_pages": total_pages}
+        )
+        for i, text in enumerate(texts)
+        if text.strip()
+    ]
 
-        pdf.output(pdf_path)
-        logger.info(f"✅ MSG converted to PDF: {pdf_path}")
-        return pdf_path
-    except ImportError:
-        logger.error("❌ extract_msg package not installed. Run: pip install extract_msg")
-        raise
-    except Exception as e:
-        logger.error(f"❌ Failed to convert MSG to PDF: {e}")
-        raise
+_DIRECT_EXTRACTORS = {
+    ".docx": extract_text_docx,
+    ".xlsx": extract_text_xlsx,
+    ".eml": extract_text_eml,
+    ".msg": extract_text_msg,
+}
 
 # ------------------------------
 # Main Extraction Function
 # ------------------------------
 def extract_text_only(file_path: Union[str, HttpUrl]) -> List[LCDocument]:
     """
-    Extracts text from a file using PyMuPDFLoader and returns LangChain Document objects.
-    Handles URLs, DOCX, EML, MSG, XLSX, JPG/PNG, ZIP formats as well.
+    Extracts text from a file and returns LangChain Document objects.
+    PDFs (and JPG/PNG, ZIP after conversion) are parsed with PyMuPDF;
+    DOCX, XLSX, EML and MSG are read directly. URLs are downloaded first.
     """
     logger.info(f"📄 Starting text extraction for: {file_path}")
 
@@ -212,30 +298,41 @@ def extract_text_only(file_path: Union[str, HttpUrl]) -> List[LCDocument]:
         ext = os.path.splitext(parsed.path)[1].lower()
         file_path = download_file(file_path, ext or ".pdf")
 
-    # Convert formats to PDF if needed
+    # Text formats are read directly; the rest are converted to PDF if needed
     ext = os.path.splitext(file_path)[1].lower()
-    if ext == ".docx":
-        file_path = docx_to_pdf(file_path)
+    if ext in _DIRECT_EXTRACTORS:
+        docs = _DIRECT_EXTRACTORS[ext](file_path)
+        logger.info(f"✅ Extracted {len(docs)} document chunks.")
+        return docs
     elif ext in [".jpg", ".jpeg", ".png"]:
         file_path = image_to_pdf(file_path)
-    elif ext == ".xlsx":
-        file_path = xlsx_to_pdf(file_path)
     elif ext == ".zip":
         file_path = process_pdf_zip(file_path)
-    elif ext == ".eml":
-        file_path = eml_to_pdf(file_path)
-    elif ext == ".msg":
-        file_path = msg_to_pdf(file_path)
     elif ext != ".pdf":
         raise ValueError(f"Unsupported file type: {ext}")
 
     # Load PDF into LangChain docs
     try:
-        logger.info(f"📥 Loading PDF with PyMuPDFLoader: {file_path}")
-        loader = PyMuPDFLoader(file_path)
-        docs: List[LCDocument] = loader.load()
+        logger.info(f"📥 Loading PDF with PyMuPDF: {file_path}")
+        docs = extract_text_pdf(file_path)
         logger.info(f"✅ Extracted {len(docs)} document chunks.")
         return docs
     except Exception as e:
         logger.error(f"❌ PDF parsing failed: {e}")
         raise
+
+
+async def extract_text_only_async(file_path: Union[str, HttpUrl]) -> List[LCDocument]:
+    """
+    Async variant of extract_text_only: downloads with httpx, then runs the
+    CPU-bound conversion and PDF parsing in a worker thread.
+    """
+    if isinstance(file_path, HttpUrl):
+        file_path = str(file_path)
+
+    if file_path.startswith("http://") or file_path.startswith("https://"):
+        parsed = urlparse(file_path)
+        ext = os.path.splitext(parsed.path)[1].lower()
+        file_path = await download_file_async(file_path, ext or ".pdf")
+
+    return await asyncio.to_thread(extract_text_only, file_path)
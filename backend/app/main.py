@@ -2,6 +2,7 @@ from fastapi import FastAPI, Request, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from fastapi.openapi.utils import get_openapi
+import hmac
 import logging
 from app.api import router as api_router
 from app.config import settings
@@ -11,6 +12,9 @@ logging.basicConfig(
     format="%(asctime)s | %(levelname)s | %(name)s | %(message)s"
 )
 
+# Encoded once so each request only does a constant-time compare
+_BEARER_TOKEN = settings.BEARER_TOKEN.encode()
+
 
 app = FastAPI(
     title="LLM Query Retrieval API",
@@ -38,8 +42,8 @@ async def authenticate_request(request: Request, call_next):
                 content={"detail": "Missing or invalid Authorization header"}
             )
 
-        token = auth_header.split("Bearer ")[1].strip()
-        if token != settings.BEARER_TOKEN:
+        token = auth_header[len("Bearer "):].strip()
+        if not hmac.compare_digest(token.encode(), _BEARER_TOKEN):
             return JSONResponse(
                 status_code=status.HTTP_403_FORBIDDEN,
                 content={"detail": "Invalid token provided"}
@@ -0,0 +1,12 @@
+# Page-range PDF extraction for the worker processes in extractor.py.
+# Kept to a single fitz import: spawned workers import this module to unpickle
+# the task, so anything heavier here would be loaded into every worker.
+from typing import List
+
+import fitz  # PyMuPDF
+
+
+def extract_pdf_pages(file_path: str, start: int, stop: int) -> List[str]:
+    """Extracts text for pages [start, stop); runs in a worker process."""
+    with fitz.open(file_path) as doc:
+        return [doc[i].get_text("text") for i in range(start, stop)]
@@ -1,16 +1,9 @@
+from functools import lru_cache
+
 from langchain.prompts import PromptTemplate
 
 
-def get_custom_prompt() -> PromptTemplate:
-    """
-    Returns a refined PromptTemplate for concise, professional,
-    fact-based answers from any domain document.
-    Also allows direct answering from knowledge if question relates to
-    Newton's laws of motion or Indian Constitution and context is missing.
-    """
-    return PromptTemplate(
-        input_variables=["context", "question"],
-        template="""
+CUSTOM_PROMPT_TEMPLATE = """
 You are a highly knowledgeable and expert assistant trained to extract precise, professional, and crisp answers 
 from complex documents. The document can be from any domain,
 including but not limited to legal contracts, insurance policies, technical manuals,
@@ -36,4 +29,18 @@ QUESTION:
 
 RESPONSE:
 """
+
+
+@lru_cache(maxsize=1)
+def get_custom_prompt() -> PromptTemplate:
+    """
+    Returns a refined PromptTemplate for concise, professional,
+    fact-based answers from any domain document.
+    Also allows direct answering from knowledge if question relates to
+    Newton's laws of motion or Indian Constitution and context is missing.
+    Built once per process and reused.
+    """
+    return PromptTemplate(
+        input_variables=["context", "question"],
+        template=CUSTOM_PROMPT_TEMPLATE
     )
@@ -1,7 +1,11 @@
-from typing import List
+from functools import lru_cache
+from typing import List, Optional
+import asyncio
+import faiss
+import numpy as np
 from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
 from langchain_openai import ChatOpenAI
-from langchain.chains import RetrievalQA
 
 from .prompt import get_custom_prompt
 from .config import settings
@@ -10,50 +14,95 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+FALLBACK_ANSWER = "Sorry, the model couldn't generate a response."
 
-def query_pipeline(questions: List[str], vectorstore: FAISS) -> List[str]:
+
+@lru_cache(maxsize=None)
+def _get_llm(model_name: str) -> ChatOpenAI:
+    """Returns a shared ChatOpenAI client so HTTP connections are reused across requests."""
+    return ChatOpenAI(
+        model=model_name,
+        temperature=0,
+        openai_api_key=settings.OPENAI_API_KEY  # ✅ fixed
+    )
+
+
+def retrieve_batch(
+    questions: List[str],
+    vectorstore: FAISS,
+    k: int,
+    query_vectors: Optional[np.ndarray] = None
+) -> List[List[Document]]:
+    """
+    Retrieves the top-k chunks for every question with a single index search.
+
+    Args:
+        questions (List[str]): List of user questions.
+        vectorstore (FAISS): Vectorstore built from document chunks.
+        k (int): Number of chunks to retrieve per question.
+        query_vectors (np.ndarray, optional): Precomputed question embeddings.
+
+    Returns:
+        List[List[Document]]: Retrieved chunks per question, best match first.
+    """
+    if query_vectors is None:
+        query_vectors = vectorstore.embedding_function.embed_documents(questions)
+    query_vectors = np.array(query_vectors, dtype=np.float32)
+    if vectorstore._normalize_L2:
+        faiss.normalize_L2(query_vectors)
+    _, ids = vectorstore.index.search(query_vectors, k)
+
+    return [
+        [vectorstore.docstore.search(vectorstore.index_to_docstore_id[i]) for i in row if i != -1]
+        for row in ids
+    ]
+
+
+async def aquery_pipeline(
+    questions: List[str],
+    vectorstore: FAISS,
+    query_vectors: Optional[np.ndarray] = None
+) -> List[str]:
     """
     Runs the QA pipeline on a given vectorstore and list of questions using OpenAI.
+    LLM calls for all questions are issued concurrently.
 
     Args:
         questions (List[str]): List of user questions.
         vectorstore (FAISS): Vectorstore built from document chunks.
+        query_vectors (np.ndarray, optional): Precomputed question embeddings.
 
     Returns:
-        List[str]: Answers generated by the LLM.
+        List[str]: Answers generated by the LLM, in question order.
     """
 
-    # Step 1: Set up retriever
-    retriever = vectorstore.as_retriever(search_type="similarity", search_kwargs={"k": 10})
+    # Step 1: Retrieve context for all questions at once
+    if query_vectors is None:
+        query_vectors = await vectorstore.embedding_function.aembed_documents(questions)
+    contexts = retrieve_batch(questions, vectorstore, k=settings.RETRIEVAL_K, query_vectors=query_vectors)
 
     # Step 2: Prompt template
     prompt = get_custom_prompt()
 
     # Step 3: Build LLM (OpenAI, single API key from settings)
-    llm = ChatOpenAI(
-        model=settings.QA_MODEL_NAME,     
-        temperature=0,
-        openai_api_key=settings.OPENAI_API_KEY  # ✅ fixed
-    )
+    llm = _get_llm(settings.QA_MODEL_NAME)
 
-    # Step 4: Create RetrievalQA chain
-    qa_chain = RetrievalQA.from_chain_type(
-        llm=llm,
-        retriever=retriever,
-        chain_type="stuff",
-        chain_type_kwargs={"prompt": prompt}
-    )
+    # Step 4: "Stuff" the retrieved chunks into the prompt
+    qa_chain = prompt | llm
+
+    # Step 5: Answer all questions concurrently, bounded to stay under rate limits
+    semaphore = asyncio.Semaphore(settings.QA_MAX_CONCURRENCY)
 
-    # Step 5: Process each question
-    answers = []
-    for question in questions:
+    async def answer(question: str, docs: List[Document]) -> str:
         try:
             logger.info(f"🔍 Answering question: {question}")
-            response = qa_chain.invoke(question)
-            answers.append(response["result"].strip())
+            context = "\n\n".join(doc.page_content for doc in docs)
+            async with semaphore:
+                response = await qa_chain.ainvoke({"context": context, "question": question})
             logger.info("✅ Answered successfully.")
+            return response.content.strip()
         except Exception as e:
             logger.error(f"⛔ Failed to answer question '{question}': {e}")
-            answers.append("Sorry, the model couldn't generate a response.")
+            return FALLBACK_ANSWER
 
-    return answers
+    return list(await asyncio.gather(*(answer(q, docs) for q, docs in zip(questions, contexts))))
@@ -0,0 +1,194 @@
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+import threading
+
+import faiss
+import numpy as np
+
+from .config import settings
+from .prompt import CUSTOM_PROMPT_TEMPLATE
+
+logger = logging.getLogger(__name__)
+
+# Bumped whenever the pickled layout changes
+_FORMAT_VERSION = 2
+
+
+class SemanticCache:
+    """
+    Caches answers by question embedding, scoped per document.
+    A question reuses a cached answer when its cosine similarity to a previously
+    answered question about the same document reaches the threshold.
+    The persisted cache is tagged with a signature (embedding model, QA model,
+    prompt hash) and discarded on load if any of them has changed.
+    Size is bounded: least recently used documents are evicted past max_documents,
+    and each document keeps only its newest max_entries answers.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        threshold: float,
+        signature: Tuple[str, ...],
+        max_documents: int,
+        max_entries: int
+    ):
+        self.path = path
+        self.threshold = threshold
+        self.signature = signature
+        self.max_documents = max_documents
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._dirty = False
+        # document -> normalized question vectors. Arrays are replaced, never mutated,
+        # so save() can snapshot references under the lock and pickle outside it.
+        self._vectors: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._answers: Dict[str, List[str]] = {}
+        self._indexes: Dict[str, faiss.IndexFlatIP] = {}
+        self._load()
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        vectors = np.array(vectors, dtype=np.float32, copy=True)
+        faiss.normalize_L2(vectors)
+        return vectors
+
+    def _set_entry(self, document: str, vectors: np.ndarray, answers: List[str]) -> None:
+        index = faiss.IndexFlatIP(vectors.shape[1])
+        index.add(vectors)
+        self._vectors[document] = vectors
+        self._vectors.move_to_end(document)
+        self._answers[document] = answers
+        self._indexes[document] = index
+
+    def _evict(self) -> None:
+        while len(self._vectors) > self.max_documents:
+            document, _ = self._vectors.popitem(last=False)
+            del self._answers[document]
+            del self._indexes[document]
+
+    def lookup(self, document: str, vectors: np.ndarray) -> List[Optional[str]]:
+        """
+        Finds cached answers for a batch of question embeddings.
+
+        Args:
+            document (str): Document the questions are about (e.g. its URL).
+            vectors (np.ndarray): Question embeddings, shape (n, d).
+
+        Returns:
+            List[Optional[str]]: Cached answer per question, or None on a miss.
+        """
+        with self._lock:
+            index = self._indexes.get(document)
+            if index is None or index.ntotal == 0 or len(vectors) == 0:
+                return [None] * len(vectors)
+            if index.d != vectors.shape[1]:
+                logger.warning(f"⚠️ Semantic cache dimension mismatch for {document}; treating as a miss.")
+                return [None] * len(vectors)
+
+            self._vectors.move_to_end(document)
+            scores, ids = index.search(self._normalize(vectors), 1)
+            answers = self._answers[document]
+            results = [
+                answers[i[0]] if s[0] >= self.threshold else None
+                for s, i in zip(scores, ids)
+            ]
+
+        logger.info(f"💾 Semantic cache: {sum(r is not None for r in results)}/{len(results)} hits.")
+        return results
+
+    def add(self, document: str, vectors: np.ndarray, answers: List[str]) -> None:
+        """
+        Stores answers for a batch of question embeddings in memory.
+        Persisting is left to save(), which should run off the event loop.
+
+        Args:
+            document (str): Document the questions are about (e.g. its URL).
+            vectors (np.ndarray): Question embeddings, shape (n, d).
+            answers (List[str]): Answer per question.
+        """
+        if not answers:
+            return
+
+        vectors = self._normalize(vectors)
+        answers = list(answers)
+        with self._lock:
+            existing = self._vectors.get(document)
+            if existing is not None and existing.shape[1] == vectors.shape[1]:
+                vectors = np.vstack([existing, vectors])
+                answers = self._answers[document] + answers
+
+            # Keep only the newest entries per document
+            vectors = vectors[-self.max_entries:]
+            answers = answers[-self.max_entries:]
+
+            self._set_entry(document, vectors, answers)
+            self._evict()
+            self._dirty = True
+
+    def save(self) -> None:
+        """Persists the cache if it changed since the last save. Blocking; run it in a thread."""
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                documents = {
+                    document: (vectors, self._answers[document])
+                    for document, vectors in self._vectors.items()
+                }
+                self._dirty = False
+
+            state = {"version": _FORMAT_VERSION, "signature": self.signature, "documents": documents}
+            # Unique temp file per write: other server processes may be saving the same cache
+            tmp_file = tempfile.NamedTemporaryFile(
+                dir=os.path.dirname(self.path) or ".", prefix=".semantic_cache.", suffix=".tmp", delete=False
+            )
+            try:
+                with tmp_file:
+                    pickle.dump(state, tmp_file)
+                os.replace(tmp_file.name, self.path)
+            except BaseException:
+                os.unlink(tmp_file.name)
+                with self._lock:
+                    self._dirty = True
+                raise
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "rb") as f:
+                state = pickle.load(f)
+            if not isinstance(state, dict) or state.get("version") != _FORMAT_VERSION:
+                logger.info(f"ℹ️ Discarding semantic cache in an old format: {self.path}")
+                return
+            if state.get("signature") != self.signature:
+                logger.info(f"ℹ️ Discarding semantic cache built with different models/prompt: {self.path}")
+                return
+            for document, (vectors, answers) in state["documents"].items():
+                self._set_entry(document, vectors, answers)
+            self._evict()
+            logger.info(f"📂 Loaded semantic cache for {len(self._vectors)} document(s) from: {self.path}")
+        except Exception as e:
+            logger.warning(f"⚠️ Ignoring unreadable semantic cache at {self.path}: {e}")
+
+
+def _cache_signature() -> Tuple[str, ...]:
+    """Everything a cached answer depends on besides the document and question."""
+    prompt_hash = hashlib.sha256(CUSTOM_PROMPT_TEMPLATE.encode("utf-8")).hexdigest()
+    return (settings.EMBEDDING_MODEL_NAME, settings.QA_MODEL_NAME, prompt_hash)
+
+
+semantic_cache = SemanticCache(
+    settings.SEMANTIC_CACHE_PATH,
+    settings.SEMANTIC_CACHE_THRESHOLD,
+    _cache_signature(),
+    max_documents=settings.SEMANTIC_CACHE_MAX_DOCUMENTS,
+    max_entries=settings.SEMANTIC_CACHE_MAX_ENTRIES_PER_DOCUMENT
+)
@@ -0,0 +1,31 @@
+import os
+
+# Settings are read at import time; provide the required values before importing the app
+os.environ.setdefault("BEARER_TOKEN", "test-token")
+os.environ.setdefault("GROQ_API_KEYS", '["test-groq-key"]')
+os.environ.setdefault("OPENAI_API_KEY", "test-openai-key")
+
+from fastapi.testclient import TestClient
+
+from app.config import settings
+from app.main import app
+
+client = TestClient(app)
+
+RUN_URL = f"{settings.API_PREFIX}/hackrx/run"
+PAYLOAD = {"documents": "https://example.com/policy.pdf", "questions": ["What is covered?"]}
+
+
+def test_missing_authorization_header_is_rejected():
+    response = client.post(RUN_URL, json=PAYLOAD)
+    assert response.status_code == 401
+
+
+def test_non_bearer_authorization_header_is_rejected():
+    response = client.post(RUN_URL, json=PAYLOAD, headers={"Authorization": f"Basic {settings.BEARER_TOKEN}"})
+    assert response.status_code == 401
+
+
+def test_wrong_token_is_forbidden():
+    response = client.post(RUN_URL, json=PAYLOAD, headers={"Authorization": f"Bearer {settings.BEARER_TOKEN}-wrong"})
+    assert response.status_code == 403